@@ -1 +1,4 @@
 from .session import Session
+from .scanner import Scanner
+from .scheduler import RefreshScheduler
+from .recorder import Recorder, LogReader, ReplaySession
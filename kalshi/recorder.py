@@ -0,0 +1,323 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Each chunk is MAGIC, a header, a JSON list of the market ids it contains
+# and a zlib-compressed payload of JSON lines, one per recorded response.
+# The headers double as the time index: a reader can hop from header to
+# header without decompressing anything.
+MAGIC = b'KRC1'
+_HEADER = struct.Struct('<4sddIII')
+
+
+def _scan_chunks(buf, size, path):
+    """Walks the chunk headers in `buf`.  Returns a list of
+       `(first_ts, last_ts, count, market_ids, payload_start, end)` tuples
+       for the complete chunks and the offset just past the last one."""
+    chunks = []
+    pos = 0
+    while pos + _HEADER.size <= size:
+        magic, first_ts, last_ts, count, index_len, payload_len = \
+            _HEADER.unpack_from(buf, pos)
+        if magic != MAGIC:
+            raise RuntimeError('kalshi found a corrupt chunk at offset %s in %s' % (pos, path))
+        start = pos + _HEADER.size
+        end = start + index_len + payload_len
+        if end > size:
+            break
+        market_ids = frozenset(json.loads(buf[start:start+index_len]))
+        chunks.append((first_ts, last_ts, count, market_ids, start+index_len, end))
+        pos = end
+    return chunks, pos
+
+
+class Recorder():
+    """Wraps a `kalshi.Session` and records the raw responses of
+       `get_market_order_book_cached`, `get_markets_cached` and
+       `get_market_history`, with the time they were received, into an
+       append-only chunk-compressed log.  Every other method is passed
+       through to the session unrecorded.
+
+       Records are buffered in memory and written out a chunk at a time, so
+       call `close` (or use the recorder as a context manager) when done.
+       A recorder may be shared between threads, but only one recorder
+       should append to a given file at a time.  If the file ends in a
+       truncated chunk (e.g. from a recorder that was killed mid-write), the
+       partial chunk is cut off before appending.
+
+       Timestamps in the log never decrease, since `LogReader` relies on
+       that to seek.  If the clock steps backwards, receive times are
+       clamped to the latest one already recorded.
+
+       :param kalshi.Session session: The session to record.
+       :param str path: The log file to append to.  It is created if it doesn't exist.
+       :param int chunk_records: How many records to buffer before writing a chunk.
+       :param int level: The zlib compression level.
+"""
+    def __init__(self, session, path, chunk_records=1000, level=6):
+        self.session = session
+        self.path = path
+        self.chunk_records = chunk_records
+        self.level = level
+        self._lock = threading.Lock()
+        self._buf = []
+        self._last_ts = float('-inf')
+
+        self._f = open(path, 'a+b')
+        size = os.fstat(self._f.fileno()).st_size
+        if size:
+            with mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                chunks, end = _scan_chunks(mm, size, path)
+            if chunks:
+                self._last_ts = chunks[-1][1]
+            if end != size:
+                self._f.truncate(end)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, method, market_id, args, response, ts=None):
+        """Adds a record to the log.
+
+:param str method: The name of the `Session` method the response came from.
+:param str market_id: The market the response is about, or None.
+:param dict args: The keyword arguments the method was called with.
+:param dict response: The raw response.
+:param float ts: The receive timestamp.  Defaults to now.  An explicit timestamp earlier than one already recorded raises `RuntimeError`.
+"""
+        with self._lock:
+            if ts is None:
+                ts = max(time.time(), self._last_ts)
+            elif ts < self._last_ts:
+                raise RuntimeError('kalshi.Recorder got timestamp %s, earlier than already recorded %s' %
+                                   (ts, self._last_ts))
+            self._last_ts = ts
+            self._buf.append((ts, market_id, json.dumps(
+                {'ts': ts, 'method': method, 'market_id': market_id,
+                 'args': args, 'response': response}, separators=(',', ':'))))
+            if len(self._buf) >= self.chunk_records:
+                self._flush()
+
+    def flush(self):
+        """Writes any buffered records out as a chunk."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buf:
+            return
+        # Records without a market (`get_markets_cached`) show up in the
+        # index as null, so market-filtered reads can still find them.
+        market_ids = set(m for _, m, _ in self._buf)
+        index = sorted(m for m in market_ids if m is not None)
+        if None in market_ids:
+            index.append(None)
+        index = json.dumps(index).encode()
+        payload = zlib.compress('\n'.join(line for _, _, line in self._buf).encode(), self.level)
+        header = _HEADER.pack(MAGIC, self._buf[0][0], self._buf[-1][0],
+                              len(self._buf), len(index), len(payload))
+        self._f.write(header + index + payload)
+        self._f.flush()
+        self._buf = []
+
+    def close(self):
+        """Flushes and closes the log."""
+        with self._lock:
+            if self._f.closed:
+                return
+            self._flush()
+            self._f.close()
+
+    def get_markets_cached(self):
+        """Calls and records `Session.get_markets_cached`."""
+        res = self.session.get_markets_cached()
+        self.record('get_markets_cached', None, {}, res)
+        return res
+
+    def get_market_order_book_cached(self, market_id):
+        """Calls and records `Session.get_market_order_book_cached`."""
+        res = self.session.get_market_order_book_cached(market_id)
+        self.record('get_market_order_book_cached', market_id, {}, res)
+        return res
+
+    def get_market_history(self, market_id, last_seen_ts=None):
+        """Calls and records `Session.get_market_history`."""
+        res = self.session.get_market_history(market_id, last_seen_ts=last_seen_ts)
+        self.record('get_market_history', market_id, {'last_seen_ts': last_seen_ts}, res)
+        return res
+
+
+class LogReader():
+    """Reads a log written by `Recorder`.  The file is memory-mapped and
+       only the chunk headers are read up front; chunks are decompressed
+       lazily as records are requested.
+
+       A truncated chunk at the end of the file (e.g. from a recorder that
+       was killed mid-write) is ignored.
+
+       :param str path: The log file to read.
+"""
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, 'rb')
+        size = os.fstat(self._f.fileno()).st_size
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+        self.chunks, _ = _scan_chunks(self._mm, size, path)
+        self._last_ts = [c[1] for c in self.chunks]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Unmaps and closes the log."""
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._f.close()
+
+    def market_ids(self):
+        """Returns the set of markets that appear in the log."""
+        res = set()
+        for chunk in self.chunks:
+            res |= chunk[3]
+        res.discard(None)
+        return res
+
+    def records(self, start=None, end=None, market_id=None, methods=None,
+                include_unscoped=False):
+        """Yields records in the order they were received.  Each record is a
+           dict with `ts`, `method`, `market_id`, `args` and `response` keys.
+
+:param float start: If provided, skip records received before this timestamp.
+:param float end: If provided, stop at records received after this timestamp.
+:param str market_id: If provided, only yield records about this market.
+:param list methods: If provided, only yield records from these methods.
+:param bool include_unscoped: When filtering by `market_id`, also yield records that aren't about any one market (those from `get_markets_cached`).
+"""
+        i = 0
+        if start is not None:
+            i = bisect.bisect_left(self._last_ts, start)
+        wanted = set([market_id])
+        if include_unscoped:
+            wanted.add(None)
+        for first_ts, last_ts, count, market_ids, a, b in self.chunks[i:]:
+            if end is not None and first_ts > end:
+                break
+            if market_id is not None and not wanted & market_ids:
+                continue
+            for line in zlib.decompress(self._mm[a:b]).split(b'\n'):
+                rec = json.loads(line)
+                if start is not None and rec['ts'] < start:
+                    continue
+                if end is not None and rec['ts'] > end:
+                    return
+                if market_id is not None and rec['market_id'] not in wanted:
+                    continue
+                if methods is not None and rec['method'] not in methods:
+                    continue
+                yield rec
+
+
+class ReplaySession():
+    """Replays a recorded log through the same methods as `kalshi.Session`,
+       so code written against a session can be backtested.
+
+       Iterate over `play()` to advance the replay clock; after each record
+       the session's methods return the latest response recorded at or
+       before `now`.  When starting part way through the log, everything
+       recorded before `start` is loaded first (without being yielded), and
+       `get_market_history` returns the statistics points of every recorded
+       history response for the market so far, so incremental
+       (`last_seen_ts`) recordings replay as the full history.
+
+       :param LogReader reader: The log to replay.
+       :param float start: If provided, start replaying at this timestamp.
+       :param float end: If provided, stop replaying at this timestamp.
+       :param str market_id: If provided, only replay records about this market (plus the `get_markets_cached` records).
+       :param float speed: How many times faster than real time to replay.  Defaults to as fast as possible.
+"""
+    def __init__(self, reader, start=None, end=None, market_id=None, speed=None):
+        self.reader = reader
+        self.start = start
+        self.end = end
+        self.market_id = market_id
+        self.speed = speed
+        self.now = None
+        self._markets = None
+        self._order_books = {}
+        self._histories = {}
+
+    def play(self):
+        """Yields each record as it is replayed."""
+        self.now = None
+        self._markets = None
+        self._order_books = {}
+        self._histories = {}
+        if self.start is not None:
+            for rec in self.reader.records(None, self.start, self.market_id,
+                                           include_unscoped=True):
+                if rec['ts'] >= self.start:
+                    break
+                self._apply(rec)
+            self.now = self.start
+
+        t0 = None
+        for rec in self.reader.records(self.start, self.end, self.market_id,
+                                          include_unscoped=True):
+            if self.speed is not None:
+                if t0 is None:
+                    t0 = (rec['ts'], time.monotonic())
+                delay = (rec['ts'] - t0[0]) / self.speed - (time.monotonic() - t0[1])
+                if delay > 0:
+                    time.sleep(delay)
+            self._apply(rec)
+            yield rec
+
+    def _apply(self, rec):
+        self.now = rec['ts']
+        if rec['method'] == 'get_markets_cached':
+            self._markets = rec['response']
+        elif rec['method'] == 'get_market_order_book_cached':
+            self._order_books[rec['market_id']] = rec['response']
+        elif rec['method'] == 'get_market_history':
+            points = self._histories.setdefault(rec['market_id'], {})
+            for p in rec['response'].get('market_stats_points') or []:
+                points[p.get('ts')] = p
+
+    def _missing(self, what):
+        raise RuntimeError('kalshi.ReplaySession has no recorded %s as of %s' % (what, self.now))
+
+    def get_markets_cached(self):
+        """Replays `Session.get_markets_cached`."""
+        if self._markets is None:
+            self._missing('markets')
+        return self._markets
+
+    def get_market_order_book_cached(self, market_id):
+        """Replays `Session.get_market_order_book_cached`."""
+        if market_id not in self._order_books:
+            self._missing('order book for market %s' % market_id)
+        return self._order_books[market_id]
+
+    def get_market_history(self, market_id, last_seen_ts=None):
+        """Replays `Session.get_market_history`."""
+        if market_id not in self._histories:
+            self._missing('history for market %s' % market_id)
+        points = sorted(self._histories[market_id].values(), key=lambda p: p.get('ts') or 0)
+        if last_seen_ts is not None:
+            points = [p for p in points if (p.get('ts') or 0) >= last_seen_ts]
+        return {'market_stats_points': points}
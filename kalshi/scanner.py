@@ -0,0 +1,159 @@
+import concurrent.futures
+import heapq
+import multiprocessing
+import pickle
+import time
+
+
+class Scanner():
+    """Scans markets by fetching their order books and recent statistics
+       concurrently and scoring them in a process pool.
+
+       The scoring function is called as ``fn(market, order_book, history)``
+       where ``market`` is an entry from ``get_markets_cached``,
+       ``order_book`` is the ``order_book`` object from
+       ``get_market_order_book_cached`` and ``history`` is the list of
+       ``market_stats_points`` from ``get_market_history_cached``.  It may
+       return a number (a score) or a bool (a predicate).  Markets for which
+       it returns ``None`` or ``False`` are dropped.  Since it runs in another
+       process it must be picklable, i.e. defined at module level.  Workers
+       are started fresh rather than forked, so scripts that scan need the
+       usual ``if __name__ == '__main__':`` guard.  The worker processes are
+       started on the first scan and reused by later ones until `close` is
+       called.
+
+       A market whose data can't be fetched, or for which `fn` raises, is
+       skipped; the `(market, exception)` pairs from the last scan are kept
+       in `errors`.  Errors that would affect every market, like `fn` not
+       being picklable or a worker process crashing, are raised instead.
+
+       :param kalshi.Session session: The session to fetch market data with.
+       :param int fetch_workers: How many requests to have in flight at once.
+       :param int processes: How many worker processes to score with.  Defaults to the number of CPUs.
+"""
+    def __init__(self, session, fetch_workers=8, processes=None):
+        self.session = session
+        self.fetch_workers = fetch_workers
+        self.processes = processes
+        self.errors = []
+        self._eval_pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Shuts down the worker processes."""
+        if self._eval_pool is not None:
+            self._eval_pool.shutdown()
+            self._eval_pool = None
+
+    def _get_eval_pool(self):
+        if self._eval_pool is None:
+            # Start scoring workers from a fresh server process instead of
+            # forking this one, since the fetch threads may be in the middle
+            # of requests when the first worker starts.
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context('forkserver')
+            else:
+                ctx = multiprocessing.get_context('spawn')
+            self._eval_pool = concurrent.futures.ProcessPoolExecutor(
+                self.processes, mp_context=ctx)
+        return self._eval_pool
+
+    def markets(self, category=None, status=None, market_filter=None):
+        """Lists the markets a scan would cover.
+
+:param str category: Only include markets in this category.
+:param str status: Only include markets with this status.
+:param callable market_filter: Only include markets for which `market_filter(market)` is true.
+"""
+        res = []
+        for market in self.session.get_markets_cached()['markets']:
+            if category is not None and market.get('category') != category:
+                continue
+            if status is not None and market.get('status') != status:
+                continue
+            if market_filter is not None and not market_filter(market):
+                continue
+            res.append(market)
+        return res
+
+    def _fetch(self, market, since):
+        order_book = self.session.get_market_order_book_cached(market['id'])['order_book']
+        history = self.session.get_market_history_cached(
+            market['id'], last_seen_ts=since)['market_stats_points']
+        return market, order_book, history
+
+    def scan(self, fn, category=None, status=None, market_filter=None,
+             history_window=3600):
+        """Scores every matching market, yielding `(score, market)` pairs as
+           soon as each one is ready.  Results arrive in completion order;
+           use `ranked` to get them sorted.
+
+:param callable fn: The scoring function, see the class docstring.
+:param str category: Only scan markets in this category.
+:param str status: Only scan markets with this status.
+:param callable market_filter: Only scan markets for which `market_filter(market)` is true.
+:param int history_window: How many seconds of statistics history to fetch.  `None` fetches all of it.
+"""
+        pickle.dumps(fn)
+        markets = self.markets(category, status, market_filter)
+        since = None
+        if history_window is not None:
+            since = int(time.time()) - history_window
+
+        self.errors = []
+        eval_pool = self._get_eval_pool()
+        fetch_pool = concurrent.futures.ThreadPoolExecutor(self.fetch_workers)
+        fetches = {}
+        evals = {}
+        try:
+            fetches = dict((fetch_pool.submit(self._fetch, m, since), m) for m in markets)
+            pending = set(fetches)
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    is_eval = fut in evals
+                    market = evals.pop(fut) if is_eval else fetches.pop(fut)
+                    exc = fut.exception()
+                    if isinstance(exc, (pickle.PicklingError,
+                                        concurrent.futures.BrokenExecutor)):
+                        raise exc
+                    if exc is not None:
+                        self.errors.append((market, exc))
+                    elif is_eval:
+                        score = fut.result()
+                        if score is None or score is False:
+                            continue
+                        yield score, market
+                    else:
+                        ev = eval_pool.submit(fn, *fut.result())
+                        evals[ev] = market
+                        pending.add(ev)
+        except concurrent.futures.BrokenExecutor:
+            # Start a fresh pool on the next scan.
+            self._eval_pool = None
+            raise
+        finally:
+            # Don't make a consumer that stopped early wait for the rest of
+            # the scan.
+            for fut in list(fetches) + list(evals):
+                fut.cancel()
+            fetch_pool.shutdown(wait=False)
+
+    def ranked(self, fn, limit=None, **kwargs):
+        """Like `scan`, but returns a list of `(score, market)` pairs sorted
+           from highest to lowest score.
+
+:param callable fn: The scoring function, see the class docstring.
+:param int limit: If provided, only return this many of the best results.
+"""
+        results = self.scan(fn, **kwargs)
+        key = lambda r: r[0]
+        if limit is not None:
+            return heapq.nlargest(limit, results, key=key)
+        return sorted(results, key=key, reverse=True)
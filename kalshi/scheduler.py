@@ -0,0 +1,282 @@
+import threading
+import time
+
+
+class RefreshScheduler():
+    """Keeps local copies of the order book and market data for a set of
+       markets, refreshing each one before it goes stale while staying
+       within a global request budget.
+
+       Every market has a staleness target picked by priority: markets you
+       hold a position in (per `user_get_market_positions`) use
+       `position_staleness`, markets whose volume changed within the last
+       `active_window` seconds use `active_staleness`, and everything else
+       uses `idle_staleness`.  Among the markets that are due, the one that
+       is furthest past its target (relative to that target) is refreshed
+       first, as soon as the budget allows.
+
+       A refresh that fails (e.g. a `RuntimeError` from a 429 response) is
+       counted as an attempt, so the market waits out its staleness target
+       before being retried; the last error for each market (or for
+       positions, under `None`) is kept in `errors`.
+
+       :param kalshi.Session session: The session to fetch market data with.
+       :param list market_ids: The markets to keep fresh.  Defaults to the markets on your watchlist (`user_get_watchlist`).
+       :param float requests_per_second: The global request budget.  Refreshing a market costs two requests.
+       :param float position_staleness: Staleness target in seconds for markets you hold a position in.
+       :param float active_staleness: Staleness target in seconds for recently traded markets.
+       :param float idle_staleness: Staleness target in seconds for all other markets.
+       :param float active_window: How many seconds a market counts as recently traded after its volume changes.
+       :param float positions_interval: How often in seconds to refresh positions.
+       :param callable clock: Returns the current time in seconds.  Defaults to `time.monotonic`.
+       :param callable sleep: Called with a number of seconds to wait for request budget.  Defaults to waiting until `stop` is called.
+"""
+    def __init__(self, session, market_ids=None, requests_per_second=2.0,
+                 position_staleness=5.0, active_staleness=15.0,
+                 idle_staleness=120.0, active_window=300.0,
+                 positions_interval=30.0, clock=time.monotonic, sleep=None):
+        self.session = session
+        self.requests_per_second = requests_per_second
+        self.position_staleness = position_staleness
+        self.active_staleness = active_staleness
+        self.idle_staleness = idle_staleness
+        self.active_window = active_window
+        self.positions_interval = positions_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._clock = clock
+        self._sleep = sleep or self._stop.wait
+
+        # Start with a single request's worth of budget so the first refresh
+        # can go out immediately without allowing a burst.
+        self._tokens = 1.0
+        self._tokens_ts = clock()
+
+        self.order_books = {}
+        self.markets = {}
+        self.updated = {}
+        self.errors = {}
+        self.staleness = {}
+        self.positions = set()
+        self._last_traded = {}
+        self._attempted = {}
+        self._positions_ts = None
+
+        if market_ids is None:
+            self._spend(1)
+            market_ids = self.session.user_get_watchlist()['watchlist'].get('market_ids') or []
+        self.market_ids = list(market_ids)
+
+    def add_market(self, market_id, staleness=None):
+        """Starts keeping a market fresh.
+
+:param str market_id: The id of the market.
+:param float staleness: If provided, a fixed staleness target in seconds for this market, overriding its priority.
+"""
+        with self._lock:
+            if market_id not in self.market_ids:
+                self.market_ids.append(market_id)
+            if staleness is not None:
+                self.staleness[market_id] = staleness
+
+    def remove_market(self, market_id):
+        """Stops keeping a market fresh and drops its local data.
+
+:param str market_id: The id of the market.
+"""
+        with self._lock:
+            if market_id in self.market_ids:
+                self.market_ids.remove(market_id)
+            for d in [self.order_books, self.markets, self.updated, self.errors,
+                      self.staleness, self._last_traded, self._attempted]:
+                d.pop(market_id, None)
+
+    def target(self, market_id):
+        """Returns the current staleness target in seconds for a market.
+
+:param str market_id: The id of the market.
+"""
+        if market_id in self.staleness:
+            return self.staleness[market_id]
+        if market_id in self.positions:
+            return self.position_staleness
+        last_traded = self._last_traded.get(market_id)
+        if last_traded is not None and self._clock() - last_traded < self.active_window:
+            return self.active_staleness
+        return self.idle_staleness
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self._tokens + (now - self._tokens_ts) * self.requests_per_second,
+                           max(2.0, self.requests_per_second))
+        self._tokens_ts = now
+
+    def _spend(self, n):
+        """Waits until `n` requests fit in the budget and spends them.
+           Returns False without spending anything if `stop` is called
+           while waiting."""
+        self._refill()
+        while self._tokens < n:
+            if self._stop.is_set():
+                return False
+            self._sleep((n - self._tokens) / self.requests_per_second)
+            self._refill()
+        self._tokens -= n
+        return True
+
+    def _refresh_positions(self):
+        if not self._spend(1):
+            return
+        try:
+            positions = self.session.user_get_market_positions()['market_positions']
+        except Exception as e:
+            with self._lock:
+                self.errors[None] = e
+                self._positions_ts = self._clock()
+            return
+        with self._lock:
+            self.positions = set(p['market_id'] for p in positions if p.get('position'))
+            self._positions_ts = self._clock()
+            self.errors.pop(None, None)
+
+    def _refresh_market(self, market_id):
+        if not self._spend(2):
+            return
+        try:
+            order_book = self.session.get_market_order_book_cached(market_id)['order_book']
+            market = self.session.get_market_cached(market_id)['market']
+        except Exception as e:
+            with self._lock:
+                if market_id in self.market_ids:
+                    self.errors[market_id] = e
+                    self._attempted[market_id] = self._clock()
+            return
+        with self._lock:
+            if market_id not in self.market_ids:
+                return
+            now = self._clock()
+            self.errors.pop(market_id, None)
+            self._attempted[market_id] = now
+            old = self.markets.get(market_id)
+            if old is not None and old.get('volume') != market.get('volume'):
+                self._last_traded[market_id] = now
+            self.order_books[market_id] = order_book
+            self.markets[market_id] = market
+            self.updated[market_id] = now
+
+    def _next(self):
+        """Returns `(market_id, 0)` for the market that should be refreshed
+           now, or `(None, delay)` with the time until the next one is due
+           (`delay` is None if there are no markets)."""
+        now = self._clock()
+        best = None
+        best_ratio = None
+        delay = None
+        with self._lock:
+            for market_id in self.market_ids:
+                target = self.target(market_id)
+                attempted = self._attempted.get(market_id)
+                if attempted is None:
+                    return market_id, 0.0
+                age = now - attempted
+                if age >= target:
+                    ratio = age / target
+                    if best_ratio is None or ratio > best_ratio:
+                        best, best_ratio = market_id, ratio
+                elif delay is None or target - age < delay:
+                    delay = target - age
+        if best is not None:
+            return best, 0.0
+        return None, delay
+
+    def step(self):
+        """Performs at most one refresh.  Returns the number of seconds
+           until the next refresh is due (0 if one is already due)."""
+        positions_due = 0.0
+        if self._positions_ts is not None:
+            positions_due = self._positions_ts + self.positions_interval - self._clock()
+        if positions_due <= 0:
+            self._refresh_positions()
+            return 0.0
+
+        market_id, delay = self._next()
+        if market_id is None:
+            if delay is None:
+                return positions_due
+            return min(delay, positions_due)
+        self._refresh_market(market_id)
+        return 0.0
+
+    def run(self, duration=None):
+        """Keeps refreshing markets until `stop` is called or `duration`
+           seconds have passed.
+
+:param float duration: If provided, how long to run for in seconds.
+"""
+        # A foreground run after `stop` should run again; the background
+        # thread leaves the event alone so a `stop` racing `start` isn't lost.
+        if self._thread is not threading.current_thread():
+            self._stop.clear()
+        deadline = None
+        if duration is not None:
+            deadline = self._clock() + duration
+        try:
+            while not self._stop.is_set():
+                delay = self.step()
+                if deadline is not None:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        break
+                    delay = min(delay, remaining)
+                if delay > 0:
+                    self._stop.wait(delay)
+        finally:
+            if self._thread is threading.current_thread():
+                self._thread = None
+
+    def start(self):
+        """Runs the scheduler on a background thread."""
+        if self._thread is not None:
+            raise RuntimeError('kalshi.RefreshScheduler is already running')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops a scheduler started with `start`."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+            self._thread = None
+
+    def order_book(self, market_id):
+        """Returns the local copy of a market's order book, or None if it
+           hasn't been fetched yet.
+
+:param str market_id: The id of the market.
+"""
+        with self._lock:
+            return self.order_books.get(market_id)
+
+    def market(self, market_id):
+        """Returns the local copy of a market's data, or None if it hasn't
+           been fetched yet.
+
+:param str market_id: The id of the market.
+"""
+        with self._lock:
+            return self.markets.get(market_id)
+
+    def age(self, market_id):
+        """Returns how many seconds ago a market was last refreshed, or None
+           if it hasn't been fetched yet.
+
+:param str market_id: The id of the market.
+"""
+        with self._lock:
+            updated = self.updated.get(market_id)
+        if updated is None:
+            return None
+        return self._clock() - updated
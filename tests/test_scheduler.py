@@ -0,0 +1,64 @@
+import importlib.util
+import os
+
+# Load the module directly rather than through the `kalshi` package, which
+# also imports the generated `session.py`.
+_path = os.path.join(os.path.dirname(__file__), '..', 'kalshi', 'scheduler.py')
+_spec = importlib.util.spec_from_file_location('kalshi_scheduler', _path)
+scheduler = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(scheduler)
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeSession():
+    def __init__(self, clock):
+        self.clock = clock
+        self.refreshes = {}
+
+    def user_get_market_positions(self):
+        return {'market_positions': [{'market_id': 'p', 'position': 3}]}
+
+    def get_market_order_book_cached(self, market_id):
+        self.refreshes.setdefault(market_id, []).append(self.clock())
+        return {'order_book': {'yes': [], 'no': []}}
+
+    def get_market_cached(self, market_id):
+        return {'market': {'id': market_id, 'volume': 0}}
+
+
+def run_for(s, clock, seconds):
+    while clock.now < seconds:
+        clock.now += s.step()
+
+
+def test_position_market_refreshed_every_position_staleness():
+    clock = FakeClock()
+    session = FakeSession(clock)
+    s = scheduler.RefreshScheduler(
+        session, market_ids=['p', 'a', 'i'], requests_per_second=1,
+        clock=clock, sleep=clock.sleep)
+    run_for(s, clock, 600)
+
+    times = session.refreshes['p']
+    gaps = [b - a for a, b in zip(times[1:], times[2:])]
+    assert max(gaps) <= s.position_staleness + 2.0 / s.requests_per_second
+    assert len(times) >= 600 / (s.position_staleness + 2.0)
+
+
+def test_run_after_stop():
+    clock = FakeClock()
+    session = FakeSession(clock)
+    s = scheduler.RefreshScheduler(session, market_ids=['p'], requests_per_second=100)
+    s.stop()
+    s.run(duration=0.05)
+    assert len(session.refreshes['p']) == 1